@@ -30,6 +30,49 @@ then paths against that tree without re-stating the filesystem.
 """
 Change History
 
+Version 0.7
+  * DirectoryTree now lists directories with the scandir backport, or
+    os.listdir when it is missing. With scandir, entry types come from
+    the directory listing instead of a stat() per entry.
+  * DirectoryTree walks directories with an explicit stack instead of
+    recursion (no more recursion limit on deep trees).
+  * Added workers option to DirectoryTree to list directories from a pool
+    of threads (helps on network and multi-disk filesystems), also
+    available as display's WORKERS argument.
+  * DirectoryTree.validate descends straight down the path (cost is now
+    the depth of path, not the size of the tree).
+  * Added TreeNode.get_child, a constant time lookup of a child by value.
+  * Added TreeNode.add_children, add_child for a batch of values;
+    DirectoryTree attaches each directory listing with it.
+  * TreeNode, Tree and DirectoryTree use __slots__ (smaller nodes), they
+    define __getstate__/__setstate__ so trees still pickle.
+  * DirectoryTree and Tree.from_xml intern node names, repeated names
+    (bin, lib, ...) share one string.
+  * Tree.as_text caches its result until the tree is changed.
+  * TreeNode.children returns a copy of the children, change them with
+    add_child/add_children.
+  * Tree.as_text keeps a running prefix per depth instead of rebuilding
+    every column for every line (cost per line no longer grows with
+    depth).
+  * Added lazy option to DirectoryTree, directories are listed on first
+    use (validating a few paths no longer lists the whole tree).
+  * Added Tree.iterwalk, a generator version of walk; as_text and as_xml
+    use it.
+  * Tree.walk no longer recurses.
+  * Visitors can skip a node's children by returning True, which is
+    cheaper than raising TreeSkipNode.
+  * Added DirectoryTree.stream_text and stream_xml, write the text or XML
+    of a directory without building a tree (memory follows the depth of
+    the tree, not its size); display and xml write use them.
+  * Tree.as_xml writes the XML directly instead of building a minidom
+    DOM and pretty printing it (same output).
+  * Tree.from_xml streams the XML with ElementTree.iterparse instead of
+    building a minidom DOM.
+  * TreeNode works out its string form once, when its value is set.
+  * DirectoryTree sorts directory entries by name (order no longer depends
+    on the filesystem).
+  * Fixed DirectoryTree.validate on Windows, paths are split on os.sep.
+
 Version 0.6
   * Added support for skiping nodes and their children during visitation
     (raise TreeSkipNode)
@@ -54,40 +97,171 @@ Version 0.1
   * Initial Release
 """
 __author__ = "Joshua Graff"
-__version__ = "0.6"
+__version__ = "0.7"
 
+import functools
+import io
 import os
 import sys
-from xml.dom import minidom
+from multiprocessing.pool import ThreadPool
+from operator import itemgetter
+from xml.sax.saxutils import escape
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None                  # _list_dir falls back to listdir
+
+# Characters escaped in attribute values on top of &, < and >.
+_ATTRIBUTE_ENTITIES = {'"': '&quot;'}
+
+
+def _get_slots(obj):
+    # Pickle state for classes with __slots__ (which have no __dict__ for
+    # pickle to save), the set slots of obj's class and its bases.
+    state = dict()
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+
+def _set_slots(obj, state):
+    for name, value in state.iteritems():
+        setattr(obj, name, value)
 
 
 class TreeNode(object):
 
+    # Trees can hold a node per file on disk, so skip the per instance
+    # __dict__.
+    __slots__ = ('_value', '_str', '_children', '_index')
+
+    # Bumped on every add_child and change of value so trees can tell
+    # when cached renderings are stale.
+    _generation = 0
+
     def __init__(self, value):
-        self.value = value
+        self._store_value(value)
         self._children = list()
+        self._index = dict()
+
+    def _get_value(self):
+        return self._value
+
+    def _store_value(self, value):
+        self._value = value
+        # Rendered form used by __str__, as_text, ... worked out once here
+        # instead of on every render.
+        if isinstance(value, basestring):
+            self._str = value
+        else:
+            self._str = str(value)
+
+    def _set_value(self, value):
+        # A new node isn't in any tree yet, so only renames (not __init__)
+        # need to invalidate cached renderings.
+        self._store_value(value)
+        TreeNode._generation += 1
+
+    value = property(_get_value, _set_value)
+
+    __getstate__ = _get_slots
+    __setstate__ = _set_slots
 
     def add_child(self, value):
         if not isinstance(value, TreeNode):
             value = TreeNode(value)
         self._children.append(value)
+        try:
+            self._index.setdefault(value._value, value)
+        except TypeError:
+            pass                        # unhashable, get_child scans for it
+        TreeNode._generation += 1
+
+    def add_children(self, values):
+        """Add each of values as a child, in order.
+
+        The same as calling add_child on each value, but cheaper for a
+        long run of children such as a whole directory listing.
+        """
+        append = self._children.append
+        setdefault = self._index.setdefault
+        for value in values:
+            if not isinstance(value, TreeNode):
+                value = TreeNode(value)
+            append(value)
+            try:
+                setdefault(value._value, value)
+            except TypeError:
+                pass                    # unhashable, get_child scans for it
+        TreeNode._generation += 1
 
     def has_children(self):
         return bool(self._children)
 
     def children(self):
+        """Return a list of the children.
+
+        The list is a copy, changing it doesn't change the node; use
+        add_child/add_children for that.
+        """
+        return list(self._child_list())
+
+    def _child_list(self):
+        # The live list for the walkers, which only read it.
         return self._children
+
+    def get_child(self, value):
+        """Return the (first) child whose value is value or None.
+
+        Children are found through an index of the values they were added
+        with. Children whose value can't be hashed aren't in it and a
+        renamed child is filed under its old value, so when the index
+        comes up empty (or with a renamed child) the children are
+        scanned instead. Children are only ever added through add_child
+        and add_children, which keep the index up to date, so
+        everything in it is a child.
+        """
+        try:
+            child = self._index.get(value)
+        except TypeError:
+            child = None
+        if child is not None and child._value == value:
+            return child
+        for child in self._children:
+            if child._value == value:
+                return child
+        return None
     
     def __eq__(self, other):
+        # Comparing against a plain string (validate, tests) is the common
+        # case, so try it before the isinstance() check.
+        if other.__class__ is str:
+            return self._value == other
+        if other is self:
+            return True
         if isinstance(other, TreeNode):
-            return self.value == other.value
-        return self.value == other
+            return self._value == other._value
+        return self._value == other
 
     def __ne__(self, other):
         return not self.__eq__(other)
+
+    # Nodes hash by identity: the value can be renamed (and needn't be
+    # hashable), so it can't back the hash. The child index keys on the
+    # values themselves and never hashes a node.
+    __hash__ = object.__hash__
     
     def __str__(self):
-        return str(self.value)
+        return str(self._str)
 
     def __repr__(self):
         return "TreeNode('%s')" % str(self)
@@ -96,54 +270,185 @@ class TreeNode(object):
 class TreeSkipNode(Exception): pass
 
 
+def _write_text(write, items):
+    """Render items, (string, child count, depth) triples in walk order, the
+    way Tree.as_text() does, passing each piece of output to write.
+
+    Unlike as_text() the last line ends with a newline too.
+    """
+    # Two stacks with an entry per open parent: the columns printed before
+    # its '|' (every parent's column up to and including its own spaces)
+    # and the number of its children not yet printed.
+    bases = list()
+    remaining = list()
+    for string, count, depth in items:
+        value = '+ %s' % string
+        if count:
+            value = '%s +' % value
+
+        while depth <= len(bases):
+            bases.pop()
+            remaining.pop()
+
+        if not bases:
+            write(value)
+            prefix = ''
+        else:
+            # Spacer line with a '|' under the parent, then the value.
+            base = bases[-1]
+            write(base)
+            write('|\n')
+            write(base)
+            write(value)
+            remaining[-1] -= 1
+            # Our children line up under the parent's column too,
+            # with a '|' only if the parent has more children to come.
+            if remaining[-1]:
+                prefix = base + '|'
+            else:
+                prefix = base + ' '
+        write('\n')
+
+        if count:
+            #
+            # Track whitespace depth for each node along with the
+            # number of children seen.
+            #
+            # We decrement children seen on each visit, so that
+            # we can skip '|' when there are no children left.
+            #
+            if bases:
+                size = len(value) - 2
+            else:
+                size = len(value) - 1
+            bases.append(prefix + ' ' * size)
+            remaining.append(count)
+
+
+def _write_xml(write, items):
+    """Render items, (string, child count, depth) triples in walk order, the
+    way Tree.as_xml() does, passing each piece of output to write.
+    """
+    #
+    # Written straight out while walking rather than through a DOM,
+    # in the same layout toprettyxml() gives (tab indents, leaves as
+    # empty elements).
+    #
+    write('<?xml version="1.0" ?>\n<Tree>\n')
+    # Indents of the elements still open, the <Tree> one first.
+    parents = ['']
+    for string, count, depth in items:
+        while depth < len(parents):
+            write('%s</Node>\n' % parents.pop())
+        indent = '\t' * depth
+        value = escape(str(string), _ATTRIBUTE_ENTITIES)
+        if count:
+            write('%s<Node value="%s">\n' % (indent, value))
+            parents.append(indent)
+        else:
+            write('%s<Node value="%s"/>\n' % (indent, value))
+    while len(parents) > 1:
+        write('%s</Node>\n' % parents.pop())
+    write('</Tree>\n')
+
+
 class Tree(object):
 
+    __slots__ = ('root', 'depth', '_text')
+
     def __init__(self, root=None):
         if root and not isinstance(root, TreeNode):
             root = TreeNode(root)
         self.root = root
         self.depth = 0
+        self._text = None
+
+    def __getstate__(self):
+        state = _get_slots(self)
+        # The cached text is keyed by this process's TreeNode._generation
+        state['_text'] = None
+        return state
+
+    __setstate__ = _set_slots
 
     def walk(self, visit, node=None, depth=1):
+        """Call visit(node, depth) for node (default root) and everything
+        below it, parents before children.
+
+        The children of a node are skipped if visit returns True (or
+        raises TreeSkipNode, which still works but costs an exception).
+        """
         if node is None:
             node = self.root
-        skip = False
-        try:
-            visit(node, depth)
-        except TreeSkipNode:
-            skip = True
-        if not skip:
-            for child in node.children():
-                self.walk(visit, child, depth+1)
+        # Explicit stack rather than recursion, children are pushed in
+        # reverse so they come off in order.
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack.pop()
+            try:
+                if visit(node, depth):
+                    continue
+            except TreeSkipNode:
+                continue
+            depth += 1
+            children = node._child_list()
+            stack.extend([(child, depth) for child in reversed(children)])
+
+    def iterwalk(self, node=None, depth=1):
+        """Iterate over (node, depth) pairs in the same order walk() visits
+        them.
+
+        Uses an explicit stack, not recursion, and can be stopped at any
+        point by breaking out of the loop.
+        """
+        if node is None:
+            node = self.root
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            depth += 1
+            children = node._child_list()
+            stack.extend([(child, depth) for child in reversed(children)])
+
+    def _iteritems(self):
+        # (string, child count, depth) for each node, what _write_text and
+        # _write_xml render.
+        for node, depth in self.iterwalk():
+            yield node._str, len(node._child_list()), depth
 
     def as_xml(self):
-        impl = minidom.getDOMImplementation()
-        doc = impl.createDocument(None, "Tree", None)
-        parents = list()
-        parents.append(doc.documentElement)
-        def visit(node, depth):
-            while depth < len(parents):
-                parents.pop()
-            element = doc.createElement('Node')
-            element.setAttribute('value', str(node))
-            parents[-1].appendChild(element)
-            if node.children():
-                parents.append(element)                
-        self.walk(visit)
-        return doc.toprettyxml()
+        out = list()
+        _write_xml(out.append, self._iteritems())
+        return ''.join(out)
 
     def from_xml(self, text):
-        dom = minidom.parseString(text)
-        def _create_tree(element, depth=1):
-            node = TreeNode(element.getAttribute('value'))
-            if depth > self.depth:
-                self.depth = depth
-            for child in element.childNodes:
-                if child.nodeName != 'Node':
-                    continue
-                node.add_child(_create_tree(child, depth+1))
-            return node
-        self.root = _create_tree(dom.documentElement.childNodes[1])
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        #
+        # Stream the document rather than building a DOM of it first,
+        # nodes are made as their start tags are seen and every element
+        # is dropped again once it has been closed.
+        #
+        parents = list()
+        events = ElementTree.iterparse(io.BytesIO(text), ('start', 'end'))
+        for event, element in events:
+            if element.tag != 'Node':
+                continue
+            if event == 'start':
+                node = TreeNode(_intern(element.get('value')))
+                if parents:
+                    parents[-1].add_child(node)
+                else:
+                    self.root = node
+                parents.append(node)
+                if len(parents) > self.depth:
+                    self.depth = len(parents)
+            else:
+                element.clear()
+                parents.pop()
+                if not parents:
+                    break               # only the first top level Node
         
     def as_text(self):
         """Display in ASCII text from left to right.
@@ -160,72 +465,143 @@ class Tree(object):
                  + Node_B
 
         Nodes are represented as strings via their __str__ mdethod.
-        """
-        whitespace = list()
-        lines = list()
-        def visit(node, depth):
-            value = str(node)
-            value = '+ %s' % value
-            if node.has_children():
-                value = '%s +' % value
-                
-            while depth <= len(whitespace):
-                whitespace.pop()
-                
-            # Put spacer if '|' in between each item
-            columns = list()
-            for idx, item in enumerate(whitespace):
-                size, children = item
-                if idx != 0:
-                    size -= 1
-                offset = ' ' * size
-                if children:
-                    columns.append('%s|' % offset)
-                else:
-                    columns.append('%s ' % offset)
-            if columns:
-                lines.append(''.join(columns))
 
-            # Print value with optional leading '|'
-            if not whitespace:
-                lines.append(value)
-            else:
-                columns = list()
-                for idx, item in enumerate(whitespace):
-                    size, children = item
-                    if idx != 0:
-                        size -= 1
-                    offset = ' ' * size                    
-                    if idx == len(whitespace) - 1:
-                        whitespace[idx][1] -= 1
-                        columns.append('%s%s' % (offset, value))
-                    else:
-                        if children:
-                            columns.append('%s|' % offset)
-                        else:
-                            columns.append('%s ' % offset)
-                lines.append(''.join(columns))
-
-            if node.has_children():
-                #
-                # Track whitespace depth for each node along with the
-                # number of children seen.
-                #
-                # We decrement children seen on each visit, so that
-                # we can skip '|' when there are no children left.
-                #
-                whitespace.append([(len(value) - 1), len(node.children())])
-
-        self.walk(visit)
-        return '\n'.join(lines)
+        The text is cached until the next add_child or change of value
+        (on any node) or a new root.
+        """
+        cache = self._text
+        if (cache and cache[0] is self.root and
+            cache[1] == TreeNode._generation):
+            return cache[2]
+        # All output goes into one list of fragments joined once at the end.
+        out = list()
+        _write_text(out.append, self._iteritems())
+        if out:
+            out.pop()                   # no newline after the last line
+        text = ''.join(out)
+        self._text = (self.root, TreeNode._generation, text)
+        return text
 
 
 class DirectoryTreeError(Exception): pass
 
 
+def _scandir_list_dir(path, only_dirs=False):
+    """Return a (name, path, is_dir) tuple for each entry in the directory
+    at path, sorted by name and skipping files if only_dirs.
+
+    All the filesystem work (including the stat() DirEntry needs for
+    symlinks) happens here, before any TreeNode is made, which also lets
+    it run in from_dir's worker threads.
+    """
+    entries = list()
+    for entry in scandir(path):
+        if only_dirs and entry.is_file():
+            continue
+        entries.append((entry.name, entry.path, entry.is_dir()))
+    # Directory order is up to the filesystem, sort so trees (and their
+    # text/XML) are the same everywhere. Names are unique, so sorting on
+    # the name alone gives the same order as the whole tuple, only cheaper.
+    entries.sort(key=itemgetter(0))
+    return entries
+
+
+def _listdir_list_dir(path, only_dirs=False):
+    """The same as _scandir_list_dir, for when the scandir backport isn't
+    installed. Costs a stat() (or two) per entry.
+    """
+    entries = list()
+    join = os.path.join
+    isdir = os.path.isdir
+    isfile = os.path.isfile
+    for name in os.listdir(path):
+        subpath = join(path, name)
+        if only_dirs and isfile(subpath):
+            continue
+        entries.append((name, subpath, isdir(subpath)))
+    entries.sort(key=itemgetter(0))
+    return entries
+
+if scandir is None:
+    _list_dir = _listdir_list_dir
+else:
+    _list_dir = _scandir_list_dir
+
+
+def _intern(name):
+    # Names repeat a lot across a tree (bin, lib, src, ...); interning
+    # keeps one copy and lets equal names compare by identity.
+    if name.__class__ is str:
+        return intern(name)
+    return name
+
+
+def _iterdir(path, max_depth=None, only_dirs=False):
+    """Yield (name, entry count, depth) for path and everything below it,
+    in the order DirectoryTree(path, max_depth, only_dirs).iterwalk()
+    gives its nodes, listing each directory when it is reached.
+    """
+    stack = [(os.path.basename(path), path, os.path.isdir(path), 1)]
+    while stack:
+        name, path, isdir, depth = stack.pop()
+        entries = ()
+        if isdir and depth != max_depth:
+            entries = _list_dir(path, only_dirs)
+        yield name, len(entries), depth
+        depth += 1
+        stack.extend([(_intern(name), subpath, isdir, depth)
+                      for name, subpath, isdir in reversed(entries)])
+
+
+class _LazyDirectoryNode(TreeNode):
+    """A TreeNode for a directory which isn't listed until its children
+    are first needed.
+    """
+
+    __slots__ = ('_listing',)
+
+    def __init__(self, value, listing):
+        TreeNode.__init__(self, value)
+        # (tree, path, depth, only_dirs) until listed, then None
+        self._listing = listing
+
+    def _list(self):
+        tree, path, depth, only_dirs = self._listing
+        self._listing = None
+        tree._list_lazy(self, path, depth, only_dirs)
+
+    def add_child(self, value):
+        if self._listing:
+            self._list()
+        TreeNode.add_child(self, value)
+
+    def add_children(self, values):
+        if self._listing:
+            self._list()
+        TreeNode.add_children(self, values)
+
+    def has_children(self):
+        if self._listing:
+            self._list()
+        return bool(self._children)
+
+    def _child_list(self):
+        if self._listing:
+            self._list()
+        return self._children
+
+    def get_child(self, value):
+        if self._listing:
+            self._list()
+        return TreeNode.get_child(self, value)
+
+
 class DirectoryTree(Tree):
 
-    def __init__(self, path=None, max_depth=None, only_dirs=False):
+    __slots__ = ('max_depth',)
+
+    def __init__(self, path=None, max_depth=None, only_dirs=False,
+                 workers=None, lazy=False):
         Tree.__init__(self)
         self.max_depth = max_depth
         if path and os.path.isfile(path):
@@ -235,59 +611,143 @@ class DirectoryTree(Tree):
             finally:
                 fd.close()
         elif path and os.path.isdir(path):
-            self.from_dir(path, only_dirs=only_dirs)
-
-    def from_dir(self, path, depth=1, only_dirs=False):
-        def _create_tree(rootpath, depth):
-            node = TreeNode(os.path.basename(rootpath))
-            if depth > self.depth:
-                self.depth = depth
-            if os.path.isdir(rootpath) and depth != self.max_depth:
-                for name in os.listdir(rootpath):
-                    subpath = os.path.join(rootpath, name)
-                    if only_dirs and os.path.isfile(subpath):
-                        continue
-                    child = _create_tree(subpath, depth+1)
-                    node.add_child(child)
-            return node
-        self.root = _create_tree(path, depth)
+            self.from_dir(path, only_dirs=only_dirs, workers=workers,
+                          lazy=lazy)
+
+    def from_dir(self, path, depth=1, only_dirs=False, workers=None,
+                 lazy=False):
+        """Create tree from the directory at path.
+
+        If workers is given, directories are listed by a pool of that many
+        threads. Listing a directory spends its time in the kernel (with
+        the GIL released), so this pays off on filesystems which can serve
+        several requests at once (network mounts, multiple disks).
+
+        If lazy is True, directories aren't listed until their children
+        are first asked for, so validate() only lists the directories
+        along the path it checks. self.depth then only counts what has
+        been listed so far.
+        """
+        name = os.path.basename(path)
+        if depth > self.depth:
+            self.depth = depth
+        if lazy and os.path.isdir(path) and depth != self.max_depth:
+            listing = (self, path, depth, only_dirs)
+            self.root = _LazyDirectoryNode(name, listing)
+            return
+        self.root = TreeNode(name)
+        if lazy or not os.path.isdir(path):
+            return
+        pool = None
+        listdir = map
+        if workers:
+            pool = ThreadPool(workers)
+            listdir = pool.map
+        try:
+            #
+            # List the tree one level at a time, every directory at the
+            # current depth in one batch. Children are attached in the
+            # order they are listed so the result doesn't depend on which
+            # thread finished first.
+            #
+            max_depth = self.max_depth
+            node_class = TreeNode
+            intern_name = _intern
+            list_dir = functools.partial(_list_dir, only_dirs=only_dirs)
+            pending = [(self.root, path)]
+            while pending and depth != max_depth:
+                listings = listdir(list_dir, [item[1] for item in pending])
+                depth += 1
+                next_pending = list()
+                push = next_pending.append
+                for (node, rootpath), entries in zip(pending, listings):
+                    if entries and depth > self.depth:
+                        self.depth = depth
+                    children = [node_class(intern_name(entry[0]))
+                                for entry in entries]
+                    node.add_children(children)
+                    for child, entry in zip(children, entries):
+                        if entry[2]:
+                            push((child, entry[1]))
+                pending = next_pending
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
             
+    @staticmethod
+    def stream_text(path, max_depth=None, only_dirs=False, out=None):
+        """Write DirectoryTree(path, max_depth, only_dirs).as_text() and a
+        newline to out (default sys.stdout) without building the tree.
+
+        Directories are listed as the text reaches them, so memory use
+        follows the depth of the tree rather than its size.
+        """
+        if out is None:
+            out = sys.stdout
+        _write_text(out.write, _iterdir(path, max_depth, only_dirs))
+
+    @staticmethod
+    def stream_xml(path, max_depth=None, only_dirs=False, out=None):
+        """Write DirectoryTree(path, max_depth, only_dirs).as_xml() to out
+        (default sys.stdout) without building the tree, see stream_text.
+        """
+        if out is None:
+            out = sys.stdout
+        _write_xml(out.write, _iterdir(path, max_depth, only_dirs))
+
+    def _list_lazy(self, node, path, depth, only_dirs):
+        depth += 1
+        entries = _list_dir(path, only_dirs)
+        if entries and depth > self.depth:
+            self.depth = depth
+        for name, subpath, isdir in entries:
+            name = _intern(name)
+            if isdir and depth != self.max_depth:
+                listing = (self, subpath, depth, only_dirs)
+                child = _LazyDirectoryNode(name, listing)
+            else:
+                child = TreeNode(name)
+            node.add_child(child)
+
     def validate(self, path):
         """Validate path against this tree and throw an exception if path
         is invalid.
         """
+        # normpath() leaves only os.sep separators (it turns '/' into '\\'
+        # on Windows), so that is what to split on.
         path = os.path.normpath(path)
-        parts = [part.strip() for part in path.split('/')]
-        valid = list()
+        parts = [part.strip() for part in path.split(os.sep)]
         if parts[0] != self.root:
-            mesg = list()
-            mesg.append("'%s' is not valid." % parts[0])
-            mesg.append("Valid entries are:")
-            mesg.append('  %s' % self.root)
-            raise DirectoryTreeError('\n'.join(mesg))
-        def visit(node, depth):
-            if node != parts[depth-1]:
-                raise TreeSkipNode
-            valid.append(node.value)            
-            if depth > (len(parts)-1):
-                raise TreeSkipNode
-
-            if node.children() and parts[depth] not in node.children():
-                mesg = list()
-                mesg.append("'%s' is not valid." % '/'.join(parts[:depth+1]))
-                mesg.append("Valid entries are:")
-                for child in node.children():
-                    mesg.append('  %s/%s' % ('/'.join(parts[:depth]), child))
+            raise DirectoryTreeError("'%s' is not valid.\n"
+                                     "Valid entries are:\n"
+                                     "  %s" % (parts[0], self.root))
+        #
+        # Only the nodes along path matter, so descend one child per
+        # part rather than walking the whole tree. Nothing is built for
+        # the error messages unless we are about to raise.
+        #
+        node = self.root
+        depth = 1
+        while depth < len(parts) and node.has_children():
+            child = node.get_child(parts[depth])
+            if child is None:
+                prefix = '/'.join(parts[:depth])
+                mesg = ["'%s/%s' is not valid." % (prefix, parts[depth]),
+                        "Valid entries are:"]
+                for child in node._child_list():
+                    mesg.append('  %s/%s' % (prefix, child))
                 raise DirectoryTreeError('\n'.join(mesg))
-        self.walk(visit)
-        if len(parts) > len(valid):
-            mesg = list()
-            mesg.append("'%s' is not a valid subdirectory or file in '%s'" %
-                        ('/'.join(parts), '/'.join(valid)))
-            raise DirectoryTreeError('\n'.join(mesg))
+            node = child
+            depth += 1
+        if depth < len(parts):
+            raise DirectoryTreeError(
+                "'%s' is not a valid subdirectory or file in '%s'" %
+                ('/'.join(parts), '/'.join(parts[:depth])))
         return '/'.join(parts)
 
 
+import pickle
 import tempfile
 import shutil
 import unittest
@@ -358,6 +818,70 @@ class TestDirectoryTree(unittest.TestCase):
         self.assertEqual(tree.root.children()[0], 'a',
                          'Tree child mismatch')
 
+    def test_simple_tree_iterwalk(self):
+        tree = self.create_simple_tree()
+        self.assertEqual(list(tree.iterwalk()), [('root', 1), ('a', 2)])
+
+    def test_simple_tree_add_children(self):
+        tree = self.create_simple_tree()
+        child = TreeNode('c')
+        tree.root.add_children(['b', child])
+        self.assertEqual(tree.root.children(), ['a', 'b', 'c'],
+                         'Tree children mismatch')
+        self.assertTrue(tree.root.get_child('c') is child,
+                        'Tree child lookup mismatch')
+
+    def test_tree_get_child(self):
+        tree = Tree('root')
+        tree.root.add_child([1, 2])
+        tree.root.add_children([{}, 'a'])
+        self.assertEqual(tree.root.get_child([1, 2]), [1, 2])
+        self.assertEqual(tree.root.get_child({}), {})
+        self.assertEqual(tree.root.get_child('b'), None)
+        child = tree.root.get_child('a')
+        child.value = 'b'
+        self.assertTrue(tree.root.get_child('b') is child)
+        self.assertEqual(tree.root.get_child('a'), None)
+        # Changing the list children() returns leaves the node alone
+        children = tree.root.children()
+        children.remove(child)
+        children.append(TreeNode('c'))
+        self.assertTrue(tree.root.get_child('b') is child)
+        self.assertEqual(tree.root.get_child('c'), None)
+
+    def test_tree_node_hash(self):
+        node = TreeNode('a')
+        nodes = set([node])
+        node.value = 'b'
+        self.assertTrue(node in nodes)
+        self.assertEqual(len(set([TreeNode('x'), TreeNode('x')])), 2)
+        node = TreeNode({})
+        self.assertTrue(node in set([node]))
+
+    def test_simple_tree_validate_renamed(self):
+        tree = self.create_simple_tree()
+        tree.root.children()[0].value = 'b'
+        tree.validate('root/b')
+        self.assertRaises(DirectoryTreeError, tree.validate, "root/a")
+
+    def test_complex_tree_walk_skip(self):
+        tree = self.create_complex_tree()
+        visited = list()
+        def visit(node, depth):
+            visited.append((str(node), depth))
+            if node == 'dir_a':
+                raise TreeSkipNode
+        tree.walk(visit)
+        self.assertEqual(visited, [('root', 1), ('dir_a', 2), ('dir_c', 2),
+                                   ('1', 3), ('dir_d', 2)])
+        del visited[:]
+        def visit(node, depth):
+            visited.append((str(node), depth))
+            return node == 'dir_a'
+        tree.walk(visit)
+        self.assertEqual(visited, [('root', 1), ('dir_a', 2), ('dir_c', 2),
+                                   ('1', 3), ('dir_d', 2)])
+
     def test_simple_tree_valid(self):
         tree = self.create_simple_tree()
         tree.validate('root')
@@ -384,6 +908,29 @@ class TestDirectoryTree(unittest.TestCase):
         text = textwrap.dedent(text).strip()
         self.assertEqual(tree.as_text(), text)
 
+    def test_tree_as_text_cache(self):
+        tree = self.create_simple_tree()
+        text = tree.as_text()
+        self.assertTrue(tree.as_text() is text)
+        tree.root.children()[0].add_child('b')
+        self.assertEqual(tree.as_text(), '+ root +\n       |\n'
+                         '       + a +\n           |\n           + b')
+        tree.root.value = 'renamed'
+        self.assertEqual(tree.as_text(), '+ renamed +\n          |\n'
+                         '          + a +\n              |\n'
+                         '              + b')
+        tree.root.children()[0].value = 'c'
+        self.assertEqual(tree.as_text(), '+ renamed +\n          |\n'
+                         '          + c +\n              |\n'
+                         '              + b')
+        tree.root.children().append(TreeNode('x'))
+        self.assertEqual(len(tree.root.children()), 1)
+        self.assertEqual(tree.as_text(), '+ renamed +\n          |\n'
+                         '          + c +\n              |\n'
+                         '              + b')
+        tree.root = TreeNode('other')
+        self.assertEqual(tree.as_text(), '+ other')
+
     def test_complex_tree_as_xml(self):
         tree = self.create_complex_tree()
         xml = '<?xml version="1.0" ?>\n<Tree>\n\t<Node value="root">' \
@@ -445,21 +992,107 @@ class TestDirectoryTree(unittest.TestCase):
                           'root/dir_a/1')        
         tree.validate('root/dir_a/dir_b')
 
+    def test_complex_tree_stream(self):
+        self.create_complex_tree()
+        path = os.path.join(self.scratch, 'root')
+        for max_depth in (None, 2, 3):
+            for only_dirs in (False, True):
+                tree = DirectoryTree(path, max_depth, only_dirs=only_dirs)
+                out = io.BytesIO()
+                DirectoryTree.stream_text(path, max_depth, only_dirs, out)
+                self.assertEqual(out.getvalue(), tree.as_text() + '\n')
+                out = io.BytesIO()
+                DirectoryTree.stream_xml(path, max_depth, only_dirs, out)
+                self.assertEqual(out.getvalue(), tree.as_xml())
+
+    def test_complex_tree_workers(self):
+        self.create_complex_tree()
+        path = os.path.join(self.scratch, 'root')
+        for max_depth in (None, 2, 3):
+            other = DirectoryTree(path, max_depth, workers=4)
+            tree = DirectoryTree(path, max_depth)
+            self.assertEqual(other.depth, tree.depth)
+            self.assertEqual(other.as_text(), tree.as_text())
+
+    def test_complex_tree_lazy(self):
+        tree = self.create_complex_tree()
+        path = os.path.join(self.scratch, 'root')
+        lazy = DirectoryTree(path, lazy=True)
+        self.assertEqual(lazy.depth, 1)
+        lazy.validate('root/dir_c/1')
+        self.assertEqual(lazy.depth, 3)
+        self.assertRaises(DirectoryTreeError, lazy.validate,
+                          'root/dir_a/dir_b/2')
+        self.assertEqual(lazy.as_text(), tree.as_text())
+        self.assertEqual(lazy.depth, tree.depth)
+        for max_depth in (2, 3):
+            lazy = DirectoryTree(path, max_depth, lazy=True)
+            tree = DirectoryTree(path, max_depth)
+            self.assertEqual(lazy.as_text(), tree.as_text())
+            self.assertEqual(lazy.depth, tree.depth)
+        lazy = DirectoryTree(path, only_dirs=True, lazy=True)
+        tree = DirectoryTree(path, only_dirs=True)
+        self.assertEqual(lazy.as_text(), tree.as_text())
+
+    def test_complex_tree_listdir(self):
+        global _list_dir
+        tree = self.create_complex_tree()
+        path = os.path.join(self.scratch, 'root')
+        only_dirs = DirectoryTree(path, only_dirs=True)
+        saved = _list_dir
+        _list_dir = _listdir_list_dir
+        try:
+            self.assertEqual(DirectoryTree(path).as_text(), tree.as_text())
+            self.assertEqual(DirectoryTree(path, only_dirs=True).as_text(),
+                             only_dirs.as_text())
+        finally:
+            _list_dir = saved
+
+    def test_complex_tree_pickle(self):
+        tree = self.create_complex_tree()
+        path = os.path.join(self.scratch, 'root')
+        lazy = DirectoryTree(path, lazy=True)
+        lazy.validate('root/dir_c/1')
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            for original in (tree, lazy):
+                other = pickle.loads(pickle.dumps(original, protocol))
+                self.assertEqual(other.depth, original.depth)
+                self.assertEqual(other.max_depth, original.max_depth)
+                self.assertEqual(other.as_text(), tree.as_text())
+                other.validate('root/dir_a/dir_b/1')
+
+    def test_deep_tree_depth(self):
+        os.makedirs(os.path.join(self.scratch, 'root', *(['d'] * 100)))
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(60)
+        try:
+            tree = DirectoryTree(os.path.join(self.scratch, 'root'))
+        finally:
+            sys.setrecursionlimit(limit)
+        self.assertEqual(tree.depth, 101)
+
         
 def test():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestDirectoryTree)
     unittest.TextTestRunner(verbosity=2).run(suite)
     return 0
 
-def display(path, depth):
-    tree = DirectoryTree(path, depth)
-    print tree.as_text()
+def display(path, depth, workers=None):
+    if workers or not os.path.isdir(path):
+        tree = DirectoryTree(path, depth, workers=workers)
+        print tree.as_text()
+    else:
+        # Only the text is wanted, so skip building the tree.
+        DirectoryTree.stream_text(path, depth)
     return 0
 
 def xml(path, type, depth):
     if type == 'write':
-        tree = DirectoryTree(path, depth)
-        print tree.as_xml()
+        if os.path.isdir(path):
+            DirectoryTree.stream_xml(path, depth)
+        else:
+            tree = DirectoryTree(path, depth)
+            print tree.as_xml()
         return 0
     if type == 'read':
         tree = DirectoryTree(path, depth)
@@ -468,9 +1101,10 @@ def xml(path, type, depth):
 def usage(prog):
     print __doc__
     print "Usage: %s [display|test] [options]" % prog
-    print "  display PATH [DEPTH]"
+    print "  display PATH [DEPTH] [WORKERS]"
     print "    Graphical representation of PATH (default CWD) displayed to"
-    print "    DEPTH."
+    print "    DEPTH. If WORKERS is given list directories with that many"
+    print "    threads."
     print
     print "  xml PATH [write|read] [DEPTH]"
     print "    If 'write' (default) dump an XML file of PATH and if 'read'"
@@ -488,11 +1122,14 @@ def main(args):
     elif args[1] == 'display':
         path = os.getcwd()
         depth = None
+        workers = None
         if len(args) >= 3:
             path = args[2]
         if len(args) >= 4:
             depth = int(args[3])
-        return display(path, depth)
+        if len(args) >= 5:
+            workers = int(args[4])
+        return display(path, depth, workers)
     elif args[1] == 'xml':
         path = os.getcwd()
         type = 'write'
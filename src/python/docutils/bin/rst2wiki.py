@@ -24,14 +24,17 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import locale
-try:
-    locale.setlocale(locale.LC_ALL, '')
-except:
-    pass
 
-from docutils.core import publish_cmdline, default_description
-from docutils.writers import wiki
 
-description = ("Generates Wiki documents.  " + default_description)
+if __name__ == '__main__':
+    try:
+        locale.setlocale(locale.LC_ALL, '')
+    except locale.Error:
+        pass
 
-publish_cmdline(writer=wiki.Writer(), description=description)
+    from docutils.core import publish_cmdline, default_description
+    from docutils.writers import wiki
+
+    description = ("Generates Wiki documents.  " + default_description)
+
+    publish_cmdline(writer=wiki.Writer(), description=description)
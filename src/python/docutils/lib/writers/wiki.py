@@ -22,6 +22,7 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import posixpath
 import re
 
 from docutils import nodes, writers, languages
@@ -48,10 +49,8 @@ class Writer(writers.Writer):
         writers.Writer.__init__(self)
 
     def translate(self):
-        if self.document.settings.wiki == 'twiki':
-            visitor = TWikiTranslator(self.document)
-        elif self.document.settings.wiki == 'confluence':
-            visitor = ConfluenceTranslator(self.document)
+        translator_class = _translators[self.document.settings.wiki]
+        visitor = translator_class(self.document)
         self.document.walkabout(visitor)
         self.output = visitor.astext()
 
@@ -64,9 +63,11 @@ class WikiTranslator(nodes.NodeVisitor):
         lcode = settings.language_code
         self.language = languages.get_language(lcode, document.reporter)
         self.body = list()
+        self._deferred = list()             # indexes of defer()ed text
         self.context = list()
         self.section_level = 1
         self.section_refs = dict()
+        self._title_prefixes = dict()
         self.list_level = 0
         self.list_type = list()
         self.emphasis_start = None
@@ -82,6 +83,7 @@ class WikiTranslator(nodes.NodeVisitor):
         self.literal_block_start = None
         self.literal_block_end = None
         self._literal_block_indent = 0
+        self._literal_block_space = ''
         self.in_table = False
         self.in_table_header = False
         self.table_header_width = 0
@@ -92,6 +94,7 @@ class WikiTranslator(nodes.NodeVisitor):
         self.toc = None
         self.block_quote_start = None
         self.block_quote_end = None
+        self._block_quotes = list()
         self.in_definition_list = False
         self.definition_start = None
         self.definition_end = None
@@ -110,35 +113,109 @@ class WikiTranslator(nodes.NodeVisitor):
                 fd.close()
         self.escape_word_start = ''
         self.escape_word_end = ''
+        self._escape_word_patterns = None
+        # Every translator class gets a dispatch table of its own, an
+        # inherited one would hand out the base class's methods.
+        cls = self.__class__
+        if '_node_methods' not in cls.__dict__:
+            cls._node_methods = dict()
+
+    def node_methods(self, node_class):
+        """Return the (visit, depart) functions for node_class, taking
+        unknown_visit/unknown_departure where there is no visit_/depart_
+        method for it.
+
+        Looked up once per translator class and node class, and kept in
+        the class's _node_methods dict.
+        """
+        methods = self._node_methods.get(node_class)
+        if methods is None:
+            cls = self.__class__
+            name = node_class.__name__
+            visit = getattr(cls, 'visit_' + name, cls.unknown_visit)
+            depart = getattr(cls, 'depart_' + name, cls.unknown_departure)
+            methods = (visit.__func__, depart.__func__)
+            self._node_methods[node_class] = methods
+        return methods
+
+    def dispatch_visit(self, node):
+        """Call the visit_ method for node's class, else unknown_visit.
+
+        The same as NodeVisitor.dispatch_visit, only with the method found
+        through node_methods() instead of by getattr() on every node.
+        """
+        try:
+            visit = self._node_methods[node.__class__][0]
+        except KeyError:
+            visit = self.node_methods(node.__class__)[0]
+        if self.document.reporter.debug_flag:
+            self.document.reporter.debug(
+                'docutils.nodes.NodeVisitor.dispatch_visit calling %s for %s'
+                % (visit.__name__, node.__class__.__name__))
+        return visit(self, node)
+
+    def dispatch_departure(self, node):
+        """Call the depart_ method for node's class, else unknown_departure,
+        see dispatch_visit.
+        """
+        try:
+            depart = self._node_methods[node.__class__][1]
+        except KeyError:
+            depart = self.node_methods(node.__class__)[1]
+        if self.document.reporter.debug_flag:
+            self.document.reporter.debug(
+                'docutils.nodes.NodeVisitor.dispatch_departure calling %s '
+                'for %s' % (depart.__name__, node.__class__.__name__))
+        return depart(self, node)
+
+    def defer(self, fn, *args):
+        """Append the text fn(*args) will return to self.body, calling fn
+        from astext() once the whole document has been walked.
+
+        Deferred functions like this are often used to render links
+        which must wait till we walk the document for link discovery.
+        Until then self.body holds a (fn, args...) tuple in their place.
+        """
+        self._deferred.append(len(self.body))
+        self.body.append((fn,) + args)
 
     def astext(self):
-        for idx, item in enumerate(self.body):
-            if not isinstance(item, tuple):
-                continue
+        body = self.body
+        size = len(body)
+        for idx in self._deferred:
             #
-            # We have encountered a tuple which represents
-            # a function we have to render to extract text.
+            # Only the indexes defer() handed out can hold a tuple,
+            # one may since have been popped off body again though.
             #
-            # Deferred functions like this are often used
-            # to render links which must wait till we walk
-            # the document for link discovery.
-            # 
+            if idx >= size:
+                continue
+            item = body[idx]
+            if not isinstance(item, tuple):
+                continue
             fn = item[0]
             args = item[1:]
             text = fn(*args)
             if not text:
                 text = ''
-            self.body[idx] = text
-        return ''.join(self.body)
+            body[idx] = text
+        return ''.join(body)
     
     def escape(self, text):
         return text    
 
     def strip(self):
         """Remove all whitespace at the end of self.body."""
-        while self.body and not self.body[-1].strip():
-            self.body.pop()
-        self.body[-1] = self.body[-1].rstrip()
+        body = self.body
+        end = len(body)
+        # Deferred (function, args) tuples are links, so count as text
+        while end:
+            item = body[end - 1]
+            if not isinstance(item, basestring) or item.strip():
+                break
+            end -= 1
+        del body[end:]
+        if end and isinstance(body[-1], basestring):
+            body[-1] = body[-1].rstrip()
 
     def visit_document(self, node):
         pass
@@ -147,27 +224,51 @@ class WikiTranslator(nodes.NodeVisitor):
         self.body.append('\n')
 
     def visit_Text(self, node):
+        # Called for every bit of text, so branch on the literal block
+        # state once and read what each path needs into locals.
         text = node.astext()
-        if (self.in_paragraph or self.list_level) and not self.in_literal_block:
+        if self.in_literal_block:
+            text = self.escape(text)
+            space = self._literal_block_space
+            if space and text:
+                # Indent every line, but not after a final newline
+                indented = text.replace('\n', '\n' + space)
+                if text.endswith('\n'):
+                    indented = indented[:-len(space)]
+                text = space + indented
+            self.body.append(text)
+            return
+        body = self.body
+        in_paragraph = self.in_paragraph
+        list_level = self.list_level
+        if (in_paragraph or list_level) and '\n' in text:
             text = text.replace('\n', ' ') # join lines split in a paragraph
         text = self.escape(text)
-        if self.in_literal_block:
-            text = ''.join(['%s%s' % (self.literal_block_indent(), line)
-                            for line in text.splitlines(True)])
-        elif (isinstance(self.body[-1], basestring) and
-              self.body[-1].endswith('\n')):
-            if ((self.in_paragraph and self.list_level) and
+        last = body[-1]
+        if isinstance(last, basestring) and last.endswith('\n'):
+            if ((in_paragraph and list_level) and
                 not self.first_list_paragraph):
                 text = '%s%s' % (self.list_indent(), text)
-        
-        if not self.in_literal_block:
+        for pattern, repl in self.escape_word_patterns():
+            text = pattern.sub(repl, text)
+        body.append(text)
+
+    def escape_word_patterns(self):
+        """Return a (compiled pattern, replacement) pair for each of
+        self.escape_words.
+
+        Compiled on first use, once the subclass has set
+        escape_word_start and escape_word_end.
+        """
+        if self._escape_word_patterns is None:
+            self._escape_word_patterns = patterns = list()
             for word in self.escape_words:
                 pattern = r'(?P<start>\b)%s(?P<end>\b)' % word
                 repl = r'\g<start>%s%s%s\g<end>' % \
                        (self.escape_word_start, word,
                         self.escape_word_end)
-                text = re.sub(pattern, repl, text)
-        self.body.append(text)
+                patterns.append((re.compile(pattern), repl))
+        return self._escape_word_patterns
         
     def depart_Text(self, node):
         pass
@@ -182,12 +283,12 @@ class WikiTranslator(nodes.NodeVisitor):
         self.in_paragraph = True
     
     def depart_paragraph(self, node):
-        # newline may be escaped within a table
-        newline = self.escape('\n')
+        # No newlines within a table, so there is nothing to escape here
         if not self.in_table:
-            if not isinstance(node.parent, nodes.list_item):
-                self.body.append(newline)
-            self.body.append(newline)
+            if isinstance(node.parent, nodes.list_item):
+                self.body.append('\n')
+            else:
+                self.body.append('\n\n')
         self.in_paragraph = False
         self.first_list_paragraph = False
 
@@ -237,7 +338,12 @@ class WikiTranslator(nodes.NodeVisitor):
             anchor = self.title_anchor(node.astext())
             for refid in self.context.pop():
                 self.section_refs[refid] = anchor
-        self.body.append(self.title_prefix())
+        # title_prefix() only depends on the level, so ask once per level
+        level = self.section_level
+        prefix = self._title_prefixes.get(level)
+        if prefix is None:
+            prefix = self._title_prefixes[level] = self.title_prefix()
+        self.body.append(prefix)
 
     def depart_title(self, node):
         self.body.append('\n\n')
@@ -291,18 +397,23 @@ class WikiTranslator(nodes.NodeVisitor):
     #       anything that would result in markup
     #
     def visit_block_quote(self, node):
+        # Whether this quote is only paragraphs, for depart_block_quote too
+        quoted = True
         for child in node.children:
             if not isinstance(child, nodes.paragraph):
-                return
+                quoted = False
+                break
+        self._block_quotes.append(quoted)
+        if not quoted:
+            return
 
         if self.block_quote_start:
             self.body.append(self.block_quote_start)
             self.body.append('\n')
             
     def depart_block_quote(self, node):
-        for child in node.children:
-            if not isinstance(child, nodes.paragraph):
-                return
+        if not self._block_quotes.pop():
+            return
         if self.block_quote_end:
             if not self.body[-1].endswith('\n'):
                 self.body.append('\n')
@@ -317,6 +428,8 @@ class WikiTranslator(nodes.NodeVisitor):
 
     def visit_literal_block(self, node):
         self.in_literal_block = True
+        # Worked out once for the whole block rather than per text node
+        self._literal_block_space = self.literal_block_indent()
         if self.literal_block_start:
             self.body.append('%s%s' % (self.list_indent(),
                                        self.literal_block_start))
@@ -507,13 +620,11 @@ class WikiTranslator(nodes.NodeVisitor):
         # Add end of table markup
         if self.in_table_header:
             self.body.append(self.table_header_sep)
+            self.body.append('\n')
         else:
-            while self.table_entry_width < self.table_header_width:
-                self.body.append(self.table_entry_sep)
-                self.table_entry_width += 1
-            self.body.append(self.table_entry_sep)                
-                
-        self.body.append('\n')
+            # Pad rows missing trailing cells out to the header's width
+            missing = max(self.table_header_width - self.table_entry_width, 0)
+            self.body.append(self.table_entry_sep * (missing + 1) + '\n')
         self.table_entry_width = 0
         
     def visit_colspec(self, node):
@@ -619,28 +730,31 @@ class WikiTranslator(nodes.NodeVisitor):
         pass
 
     def visit_reference(self, node):
-        self.context.append((self.create_link,
-                            node.get('refid'), node.get('refuri'),
-                            node.get('name'), node.astext()))
+        link = (self.create_link, node.get('refid'), node.get('refuri'),
+                node.get('name'), node.astext())
+        if len(node.children) == 1 and isinstance(node[0], nodes.Text):
+            # The usual case, plain link text: emit the link straight away
+            # with no need to visit the text only to take it back off body.
+            self.defer(*link)
+            raise nodes.SkipNode
+        self.context.append(link)
         
     def depart_reference(self, node):
         self.body.pop()
-        self.body.append(self.context.pop())
+        self.defer(*self.context.pop())
 
     def create_anchor(self, id=None, uri=None, name=None, text=None):
         """Must return Markup for an anchor."""
         pass
     
     def visit_target(self, node):
-        if node.get('anonymous'):
-            return
-        self.context.append((self.create_anchor,
-                            node.get('refid'), node.get('refuri'),
-                            node.get('name'), node.astext()))        
+        pass
     
     def depart_target(self, node):
-        self.body.extend(self.context)
-        self.context = list()
+        if node.get('anonymous'):
+            return
+        self.defer(self.create_anchor, node.get('refid'), node.get('refuri'),
+                   node.get('name'), node.astext())
     #
     #
     ###
@@ -674,20 +788,19 @@ class WikiTranslator(nodes.NodeVisitor):
         self.body.append(self.escape('['))
         refid = '%s%s' % (self.footnote_prefix, node.astext())
         self.footnote_refs[node.astext()] = refid
-        self.context.append((self.create_link,
-                            refid, node.get('refuri'),
-                            node.get('name'), node.astext()))        
+        # The label is the link text, so the children aren't visited.
+        self.defer(self.create_link, refid, node.get('refuri'),
+                   node.get('name'), node.astext())
+        self.body.append(self.escape(']'))
+        raise nodes.SkipNode
 
     def depart_footnote_reference(self, node):
-        self.body.pop()
-        self.body.append(self.context.pop())        
-        self.body.append(self.escape(']'))
+        pass
 
     def visit_label(self, node):
         refid = self.footnote_refs.get(node.astext())
-        self.body.append((self.create_anchor,
-                          refid, node.get('refuri'),
-                          node.get('name'), node.astext()))
+        self.defer(self.create_anchor, refid, node.get('refuri'),
+                   node.get('name'), node.astext())
         self.body.append(' ')
         self.body.append(self.escape('['))
         
@@ -707,70 +820,13 @@ class WikiTranslator(nodes.NodeVisitor):
         pass
     
     def visit_docinfo_item(self, name):
-        self.body.append(self.table_entry_sep)
-        self.body.append(self.strong_start)
-        self.body.append(name)
-        self.body.append(self.strong_end)
-        self.body.append(':')
-        self.body.append(self.table_entry_sep)
+        self.body.append('%s%s%s%s:%s' % (self.table_entry_sep,
+                                          self.strong_start or '', name,
+                                          self.strong_end or '',
+                                          self.table_entry_sep))
 
     def depart_docinfo_item(self):
-        self.body.append(self.table_entry_sep)
-        self.body.append('\n')
-
-    def visit_version(self, node):
-        self.visit_docinfo_item('Version')
-    
-    def depart_version(self, node):
-        self.depart_docinfo_item()
-    
-    def visit_author(self, node):
-        self.visit_docinfo_item('Author')
-    
-    def depart_author(self, node):
-        self.depart_docinfo_item()
-
-    def visit_authors(self, node):
-        self.visit_docinfo_item('Authors')
-    
-    def depart_authors(self, node):
-        self.depart_docinfo_item()
-        
-    def visit_contact(self, node):
-        self.visit_docinfo_item('Contact')
-
-    def depart_contact(self, node):
-        self.depart_docinfo_item()
-
-    def visit_revision(self, node):
-        self.visit_docinfo_item('Revision')
-
-    def depart_revision(self, node):
-        self.depart_docinfo_item()
-
-    def visit_date(self, node):
-        self.visit_docinfo_item('Date')
-
-    def depart_date(self, node):
-        self.depart_docinfo_item()
-
-    def visit_copyright(self, node):
-        self.visit_docinfo_item('Copyright')
-
-    def depart_copyright(self, node):
-        self.depart_docinfo_item()
-
-    def visit_organization(self, node):
-        self.visit_docinfo_item('Organization')
-
-    def depart_organization(self, node):
-        self.depart_docinfo_item()
-
-    def visit_status(self, node):
-        self.visit_docinfo_item('Status')
-
-    def depart_status(self, node):
-        self.depart_docinfo_item()        
+        self.body.append(self.table_entry_sep + '\n')
     #
     # End Docinfo
     ###
@@ -778,78 +834,61 @@ class WikiTranslator(nodes.NodeVisitor):
     ###
     # Start Admonition
     #
-    def visit_attention(self, node):
-        self.visit_admonition(node, 'attention')
-
-    def depart_attention(self, node):
-        self.depart_admonition(node, 'attention')
-
-    def visit_caution(self, node):
-        self.visit_admonition(node, 'caution')
-
-    def depart_caution(self, node):
-        self.depart_admonition(node, 'caution')
-
-    def visit_danger(self, node):
-        self.visit_admonition(node, 'danger')
-
-    def depart_danger(self, node):
-        self.depart_admonition(node, 'danger')
-
-    def visit_error(self, node):
-        self.visit_admonition(node, 'error')
-
-    def depart_error(self, node):
-        self.depart_admonition(node, 'error')
+    def visit_admonition(self, node, name):
+        if not self.body[-1][-1].isspace():
+            self.body.append('\n\n')
+        self.body.append('%s%s%s:\n\n' % (self.strong_start or '',
+                                          name.title(),
+                                          self.strong_end or ''))
 
-    def visit_hint(self, node):
-        self.visit_admonition(node, 'hint')
+    def depart_admonition(self, node, name):
+        pass
+    #
+    # End Admonition
+    ###
 
-    def depart_hint(self, node):
-        self.depart_admonition(node, 'hint')
 
-    def visit_important(self, node):
-        self.visit_admonition(node, 'important')
+def _admonition_visitors(name):
+    """Return the visit/depart pair for admonition name, which hand off to
+    visit_admonition/depart_admonition.
+    """
+    def visit(self, node):
+        self.visit_admonition(node, name)
 
-    def depart_important(self, node):
-        self.depart_admonition(node, 'important')
+    def depart(self, node):
+        self.depart_admonition(node, name)
 
-    def visit_note(self, node):
-        self.visit_admonition(node, 'note')
+    visit.__name__ = 'visit_%s' % name
+    depart.__name__ = 'depart_%s' % name
+    return visit, depart
 
-    def depart_note(self, node):
-        self.depart_admonition(node, 'note')
+for _name in ('attention', 'caution', 'danger', 'error', 'hint',
+              'important', 'note', 'tip', 'warning'):
+    for _method in _admonition_visitors(_name):
+        setattr(WikiTranslator, _method.__name__, _method)
 
-    def visit_tip(self, node):
-        self.visit_admonition(node, 'tip')
 
-    def depart_tip(self, node):
-        self.depart_admonition(node, 'tip')
+def _docinfo_visitors(name):
+    """Return the visit/depart pair for docinfo field name, which hand off
+    to visit_docinfo_item/depart_docinfo_item.
+    """
+    label = name.title()
 
-    def visit_warning(self, node):
-        self.visit_admonition(node, 'warning')
+    def visit(self, node):
+        self.visit_docinfo_item(label)
 
-    def depart_warning(self, node):
-        self.depart_admonition(node, 'warning')
+    def depart(self, node):
+        self.depart_docinfo_item()
 
-    def visit_admonition(self, node, name):
-        if not self.body[-1][-1].isspace():
-            self.body.append('\n')
-            self.body.append('\n')
-        if self.strong_start:
-            self.body.append(self.strong_start)
-        self.body.append(name.title())
-        if self.strong_end:
-            self.body.append(self.strong_end)
-        self.body.append(':')
-        self.body.append('\n')
-        self.body.append('\n')
+    visit.__name__ = 'visit_%s' % name
+    depart.__name__ = 'depart_%s' % name
+    return visit, depart
 
-    def depart_admonition(self, node, name):
-        pass
-    #
-    # End Admonition
-    ###
+for _name in ('version', 'author', 'authors', 'contact', 'revision', 'date',
+              'copyright', 'organization', 'status'):
+    for _method in _docinfo_visitors(_name):
+        setattr(WikiTranslator, _method.__name__, _method)
+del _name, _method
 
     
 class TWikiTranslator(WikiTranslator):
@@ -857,6 +896,13 @@ class TWikiTranslator(WikiTranslator):
     def __init__(self, document):
         WikiTranslator.__init__(self, document)
         self._list_tag_indent = 3
+        # Lists rarely nest deeper than this, so the spaces in front of
+        # list tags and list text are made once for these levels.
+        levels = range(16)
+        self._list_tag_spaces = [' ' * (level * self._list_tag_indent)
+                                 for level in levels]
+        self._list_text_spaces = [''] + [' ' * (level * self._list_tag_indent
+                                                + 2) for level in levels[1:]]
         self._literal_block_indent = 0
         self.emphasis_start = '_'
         self.emphasis_end = '_'
@@ -876,7 +922,8 @@ class TWikiTranslator(WikiTranslator):
         self.block_quote_end = '</blockquote></literal>'
         self.definition_term_start = '   $ '
         self.definition_term_end = ': '
-        self.section_anchors = list()          # Track section anchors we have seen
+        self.section_anchors = set()           # Track section anchors we have seen
+        self._anchor_counts = dict()           # Next _AN suffix to try per title
         self.footnote_prefix = 'FootNote'
         self.option_list_start = '<table border="1"><col width="20%"/><col width="80%"/>'
         self.option_list_end = '</table>'
@@ -887,21 +934,35 @@ class TWikiTranslator(WikiTranslator):
         self.description_start = '<td> '
         self.description_end = ' </td>'
         self.escape_word_start = '!'
+        self._images = dict()
+        # Header cells open with the separator and bold in one go
+        self._header_entry_start = self.table_header_sep + self.strong_start
         
+    # Replacements done by escape(), keyed by (in_table, in_literal_block)
+    _escapes = {
+        (False, False): (('<', '&lt;'), ('>', '&gt;')),
+        (True, False): (('\n', ' \\\n'), ('<', '&lt;'), ('>', '&gt;')),
+        (False, True): (),
+        (True, True): (('\n', ' \\\n'),),
+        }
+
     def escape(self, text):
-        if self.in_table:
-            text = text.replace('\n', ' \\\n')
-        if not self.in_literal_block:
-            text = text.replace('<', '&lt;')
-            text = text.replace('>', '&gt;')
+        for old, new in self._escapes[self.in_table, self.in_literal_block]:
+            if old in text:             # cheaper than a replace() that misses
+                text = text.replace(old, new)
         return text
     
     def title_prefix(self):
         return '---%s ' % ('+' * self.section_level)
 
     def title_anchor(self, title):
-        count = 0
         prefix = '_'.join(title.strip('()?:').split())
+        #
+        # Every suffix below the stored count is already taken, so
+        # resume from there; the loop only spins when another title
+        # happens to produce the same anchor text.
+        #
+        count = self._anchor_counts.get(prefix, 0)
         while True:
             if count:
                 anchor = '%s_AN%d' % (prefix, count)
@@ -910,13 +971,15 @@ class TWikiTranslator(WikiTranslator):
             if anchor not in self.section_anchors:
                 break
             count += 1
-        self.section_anchors.append(anchor)
+        self._anchor_counts[prefix] = count + 1
+        self.section_anchors.add(anchor)
         return anchor
 
     def list_indent(self):
-        if self.list_level:
-            return (' ' * ((self.list_level * self._list_tag_indent)+1)) + ' '
-        return ''
+        level = self.list_level
+        if level < len(self._list_text_spaces):
+            return self._list_text_spaces[level]
+        return ' ' * (level * self._list_tag_indent + 2)
     
     def list_prefix(self, type):
         if self.in_table:
@@ -924,10 +987,14 @@ class TWikiTranslator(WikiTranslator):
         depth = self.list_level
         if self.in_definition_list:
             depth -= 1
+        if 0 <= depth < len(self._list_tag_spaces):
+            spaces = self._list_tag_spaces[depth]
+        else:
+            spaces = ' ' * (depth * self._list_tag_indent)
         if type == 'bullet':
-            return '%s* ' % (' ' * (depth * self._list_tag_indent))
+            return spaces + '* '
         if type == 'enumerated':
-            return '%s1. ' % (' ' * (depth * self._list_tag_indent))
+            return spaces + '1. '
 
     ###
     # TWiki doesn't support lists in using Wiki syntax within
@@ -971,9 +1038,11 @@ class TWikiTranslator(WikiTranslator):
     # TWiki requires some extra strong emphasis for table headers
     #
     def visit_entry(self, node):
-        WikiTranslator.visit_entry(self, node)
         if self.in_table_header:
-            self.body.append(self.strong_start)
+            self.body.append(self._header_entry_start)
+            self.table_header_width += 1
+        else:
+            WikiTranslator.visit_entry(self, node)
         
     def depart_entry(self, node):
         WikiTranslator.depart_entry(self, node)
@@ -1015,7 +1084,13 @@ class TWikiTranslator(WikiTranslator):
     ###
 
     def image(self, uri):
-        return os.path.normpath('%ATTACHURL%/' + uri)
+        # Documents tend to use the same images (icons, logos) again and
+        # again, so each uri is only normalised once.  It is a URL, so
+        # normalise it the posix way whatever platform we run on.
+        path = self._images.get(uri)
+        if path is None:
+            path = self._images[uri] = posixpath.normpath('%ATTACHURL%/' + uri)
+        return path
     
 class ConfluenceTranslator(WikiTranslator):
 
@@ -1058,20 +1133,24 @@ class ConfluenceTranslator(WikiTranslator):
         self.section_anchors = list()          # Track section anchors we have seen
         self.escape_word_start = '{nl:'
         self.escape_word_end = '}'
+        self._list_prefixes = dict()           # (type, depth) -> list_prefix()
         
+    # Replacements done by escape(), keyed by (in_literal, in_literal_block)
+    _escapes = {
+        (False, False): ((':', '&#58;'), ('-', '\-'), ('!', '\!'),
+                         ('[', '\['), (']', '\]'), ('{', '\{'), ('}', '\}')),
+        (True, False): (('*', '\*'),
+                        (r'\\*', '\*'), # incase we already escaped
+                        ('-', '\-'), ('!', '\!'), ('[', '\['), (']', '\]'),
+                        ('{', '\{'), ('}', '\}')),
+        (False, True): (),
+        (True, True): (('*', '\*'), (r'\\*', '\*')),
+        }
+
     def escape(self, text):
-        if not (self.in_literal or self.in_literal_block):
-            text = text.replace(':', '&#58;')
-        if self.in_literal:
-            text = text.replace('*', '\*')
-            text = text.replace(r'\\*', '\*') # incase we already escaped
-        if not self.in_literal_block:
-            text = text.replace('-', '\-')
-            text = text.replace('!', '\!')
-            text = text.replace('[', '\[')
-            text = text.replace(']', '\]')
-            text = text.replace('{', '\{')
-            text = text.replace('}', '\}')
+        for old, new in self._escapes[self.in_literal, self.in_literal_block]:
+            if old in text:             # cheaper than a replace() that misses
+                text = text.replace(old, new)
         return text
     
     def title_prefix(self):
@@ -1088,10 +1167,19 @@ class ConfluenceTranslator(WikiTranslator):
         depth = self.list_level
         if self.in_definition_list:
             depth -= 1
+        key = (type, depth)
+        try:
+            return self._list_prefixes[key]
+        except KeyError:
+            pass
         if type == 'bullet':
-            return '%s ' % ('*' * depth)
+            prefix = '*' * depth + ' '
         elif type == 'enumerated':
-            return '%s ' % ('#' * depth)
+            prefix = '#' * depth + ' '
+        else:
+            return None
+        self._list_prefixes[key] = prefix
+        return prefix
 
     def create_link(self, id=None, uri=None, name=None, text=None):
         if not name:
@@ -1145,3 +1233,10 @@ class ConfluenceTranslator(WikiTranslator):
             self.body.append('{info}')
         elif name in ['tip', 'hint']:
             self.body.append('{tip}')
+
+
+# Translator class for each of Writer.supported
+_translators = {
+    'twiki': TWikiTranslator,
+    'confluence': ConfluenceTranslator,
+}